@@ -7,14 +7,30 @@ source = f"{userImage}"
 destination = "newImage.png"
 scale_percent = 12.5
 
+# JPEGs can be decoded straight at 1/2, 1/4 or 1/8 size, which skips most
+# of the decoding work; pick the largest reduction that doesn't go below
+# the target. Other formats keep the full decode (and their alpha channel)
+reduction = 1
+flags = cv2.IMREAD_UNCHANGED
+if source.lower().endswith(('.jpg', '.jpeg')):
+    for factor, reduced_flag in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                                 (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                 (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if factor * scale_percent <= 100:
+            reduction, flags = factor, reduced_flag
+            break
+
 # To open the file
-src = cv2.imread(source, cv2.IMREAD_UNCHANGED)
+src = cv2.imread(source, flags)
 
 # Calculate the new widhts and new heights
-new_width = int(src.shape[1] * scale_percent / 100)
-new_height = int(src.shape[0] * scale_percent / 100)
+new_width = int(src.shape[1] * reduction * scale_percent / 100)
+new_height = int(src.shape[0] * reduction * scale_percent / 100)
 
-# Final Image
-output = cv2.resize(src, (new_width , new_height))
+# Final Image; at exactly 1/8 the decoder already produced it
+if (new_width, new_height) == (src.shape[1], src.shape[0]):
+    output = src
+else:
+    output = cv2.resize(src, (new_width , new_height))
 
 cv2.imwrite(destination, output)
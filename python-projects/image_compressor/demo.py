@@ -33,13 +33,9 @@ def create_sample_images():
     print("✓ Created sample_image.jpg")
     
     # Create a gradient image
-    img2 = Image.new('RGB', (400, 400))
-    pixels = np.array(img2)
-    
-    for i in range(400):
-        for j in range(400):
-            pixels[i, j] = [i//2, j//2, (i+j)//4]
-    
+    i, j = np.ogrid[0:400, 0:400]
+    pixels = np.stack(np.broadcast_arrays(i // 2, j // 2, (i + j) // 4), axis=-1)
+
     img2 = Image.fromarray(pixels.astype('uint8'))
     img2.save("assets/gradient_image.png", "PNG")
     print("✓ Created gradient_image.png")
@@ -72,12 +68,13 @@ def run_demo():
         
         # Test different compression methods
         methods = ['JPEG Quality', 'PNG Optimization', 'WebP Conversion', 'Size Reduction']
+        slugs = {method: method.lower().replace(' ', '_') for method in methods}
         
         for method in methods:
             print(f"\nTesting {method}:")
             
             input_path = "assets/sample_image.jpg"
-            output_path = f"assets/compressed_{method.lower().replace(' ', '_')}"
+            output_path = f"assets/compressed_{slugs[method]}"
             
             # Determine output extension
             if method == "WebP Conversion":
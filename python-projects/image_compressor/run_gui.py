@@ -9,11 +9,13 @@ import os
 # Add src directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
-try:
-    from image_compressor import main
-    main()
-except ImportError as e:
-    print(f"Error importing image compressor: {e}")
-    print("Make sure all dependencies are installed:")
-    print("pip3 install -r requirements.txt")
-    sys.exit(1)
+# Guard the entry point so batch worker processes can re-import this module
+if __name__ == "__main__":
+    try:
+        from image_compressor import main
+        main()
+    except ImportError as e:
+        print(f"Error importing image compressor: {e}")
+        print("Make sure all dependencies are installed:")
+        print("pip3 install -r requirements.txt")
+        sys.exit(1)
@@ -6,7 +6,8 @@ import argparse
 import os
 import sys
 from pathlib import Path
-from image_compressor import ImageCompressor
+from image_compressor import ImageCompressor, DEFAULT_CACHE_DIR
+from utils import format_size
 
 def main():
     parser = argparse.ArgumentParser(description='Advanced Image Compressor CLI')
@@ -24,22 +25,28 @@ def main():
                        help='Maximum height')
     parser.add_argument('--recursive', action='store_true', 
                        help='Process directories recursively')
+    parser.add_argument('-j', '--jobs', type=int, default=None, 
+                       help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--webp-lossless', action='store_true', 
+                       help='Write "PNG Optimization" output as lossless WebP')
+    parser.add_argument('--cache-dir', nargs='?', const=DEFAULT_CACHE_DIR, default=None, 
+                       help=f'Reuse results for unchanged inputs (default dir: {DEFAULT_CACHE_DIR})')
     
     args = parser.parse_args()
     
-    compressor = ImageCompressor()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    
+    compressor = ImageCompressor(cache_dir=args.cache_dir, prefer_webp_lossless=args.webp_lossless)
     
     # Get input files
     input_files = []
+    input_root = None
     if os.path.isfile(args.input):
         input_files = [args.input]
     elif os.path.isdir(args.input):
-        for root, dirs, files in os.walk(args.input):
-            for file in files:
-                if any(file.lower().endswith(ext) for ext in compressor.supported_formats):
-                    input_files.append(os.path.join(root, file))
-            if not args.recursive:
-                break
+        input_files = compressor.find_images(args.input, args.recursive)
+        input_root = args.input
     
     if not input_files:
         print("No image files found!")
@@ -52,6 +59,7 @@ def main():
     print(f"Using method: {args.method}")
     print(f"Quality: {args.quality}")
     print(f"Max dimensions: {args.max_width}x{args.max_height}")
+    print(f"Workers: {args.jobs or os.cpu_count()}")
     print()
     
     successful = 0
@@ -59,48 +67,44 @@ def main():
     total_original_size = 0
     total_compressed_size = 0
     
-    for i, input_path in enumerate(input_files):
-        try:
-            print(f"Processing {i+1}/{len(input_files)}: {os.path.basename(input_path)}")
-            
-            # Generate output filename
-            filename = os.path.basename(input_path)
-            name, ext = os.path.splitext(filename)
-            
-            # Determine output format
-            if args.method == "WebP Conversion":
-                output_ext = ".webp"
-            elif args.method == "PNG Optimization":
-                output_ext = ".png"
-            else:
-                output_ext = ".jpg"
-            
-            output_filename = f"{name}_compressed{output_ext}"
-            output_path = os.path.join(args.output, output_filename)
-            
-            # Compress image
-            result = compressor.compress_image(
-                input_path,
-                output_path,
-                args.method,
-                args.quality,
-                (args.max_width, args.max_height)
-            )
+    tasks = [
+        (input_path,
+         compressor.get_output_path(input_path, args.output, args.method, input_root),
+         args.method, args.quality, (args.max_width, args.max_height))
+        for input_path in input_files
+    ]
+    
+    # Collect per-file lines and write them in blocks; one write per file
+    # makes stdout the bottleneck on large batches, especially when piped
+    lines = []
+    flush_every = 32
+    
+    try:
+        for i, (task, result) in enumerate(compressor.compress_batch(tasks, args.jobs)):
+            lines.append(f"Processing {i+1}/{len(input_files)}: {os.path.basename(task[0])}")
             
             if result['success']:
                 successful += 1
                 total_original_size += result['original_size']
                 total_compressed_size += result['compressed_size']
                 
-                print(f"  ✓ Compressed: {format_size(result['compressed_size'])} "
-                      f"({result['compression_ratio']:.1f}% reduction)")
+                lines.append(f"  ✓ Compressed: {format_size(result['compressed_size'])} "
+                             f"({result['compression_ratio']:.1f}% reduction)")
             else:
                 failed += 1
-                print(f"  ✗ Error: {result['error']}")
-                
-        except Exception as e:
-            failed += 1
-            print(f"  ✗ Error: {str(e)}")
+                lines.append(f"  ✗ Error: {result['error']}")
+            
+            if (i + 1) % flush_every == 0:
+                sys.stdout.write('\n'.join(lines) + '\n')
+                lines.clear()
+    except Exception as e:
+        # A worker process died (e.g. out of memory); count the rest as failed
+        failed = len(input_files) - successful
+        lines.append(f"  ✗ Batch failed: {str(e)}")
+    
+    if lines:
+        sys.stdout.write('\n'.join(lines) + '\n')
+    sys.stdout.flush()
     
     # Final results
     print(f"\n=== COMPRESSION COMPLETE ===")
@@ -113,18 +117,5 @@ def main():
         total_compression_ratio = (1 - total_compressed_size / total_original_size) * 100
         print(f"Overall compression: {total_compression_ratio:.1f}%")
 
-def format_size(size_bytes):
-    """Format file size in human readable format"""
-    if size_bytes == 0:
-        return "0 B"
-    
-    size_names = ["B", "KB", "MB", "GB"]
-    i = 0
-    while size_bytes >= 1024 and i < len(size_names) - 1:
-        size_bytes /= 1024.0
-        i += 1
-    
-    return f"{size_bytes:.1f} {size_names[i]}"
-
 if __name__ == "__main__":
     main()
@@ -5,21 +5,69 @@ A comprehensive image compression tool with multiple algorithms and formats supp
 
 import os
 import sys
+import io
+import json
+import queue
+import shutil
+import hashlib
+import mmap
+import contextlib
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from PIL import Image, ImageTk, ImageOps
 import numpy as np
 import cv2
 import customtkinter as ctk
-from typing import List, Tuple, Optional
+from typing import BinaryIO, List, Tuple, Optional, Union
 import threading
 import time
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+try:
+    from .utils import format_size
+except ImportError:
+    # Run as a script from src/ (run_gui.py, cli_compressor.py)
+    from utils import format_size
+
+# Optional: libvips streams JPEG/WebP encodes with a much smaller footprint
+try:
+    import pyvips
+except (ImportError, OSError):
+    pyvips = None
+
+# Suggested location for the optional compression cache
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'image_compressor')
+
+# Inputs larger than this are memory-mapped instead of read through stdio buffers
+MMAP_THRESHOLD = 16 << 20
+
+# Per-process compressor used by the batch worker pool
+_worker_compressor = None
+
+def _init_worker(compressor):
+    """Install the compressor used by this worker process"""
+    global _worker_compressor
+    _worker_compressor = compressor
+
+def _compress_one(data, output_path, method, quality, max_size):
+    """Compress one encoded input image in a worker, returning (result, encoded output)"""
+    return _worker_compressor._compress_data(data, output_path, method, quality, max_size)
 
 class ImageCompressor:
     """Core image compression functionality"""
     
-    def __init__(self):
-        self.supported_formats = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
+    def __init__(self, cache_dir: Optional[str] = None, prefer_webp_lossless: bool = False):
+        """
+        Args:
+            cache_dir: Directory for reusing earlier results of identical
+                inputs and settings (e.g. DEFAULT_CACHE_DIR); None disables caching
+            prefer_webp_lossless: Write "PNG Optimization" output as lossless
+                WebP unless the output path explicitly ends in .png
+        """
+        self.cache_dir = cache_dir
+        self.prefer_webp_lossless = prefer_webp_lossless
+        self.supported_formats = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp')
         self.compression_methods = {
             'JPEG Quality': self._compress_jpeg,
             'PNG Optimization': self._compress_png,
@@ -27,87 +75,552 @@ class ImageCompressor:
             'Size Reduction': self._compress_resize,
             'Advanced Lossy': self._compress_advanced_lossy
         }
+        # Methods not listed here produce JPEG output
+        self.output_formats = {
+            'PNG Optimization': 'PNG',
+            'WebP Conversion': 'WEBP'
+        }
     
-    def compress_image(self, input_path: str, output_path: str, 
+    def compress_image(self, input_source: Union[str, bytes, Image.Image, np.ndarray],
+                      output_path: Union[str, BinaryIO], 
                       method: str = 'JPEG Quality', quality: int = 85, 
-                      max_size: Tuple[int, int] = None) -> dict:
+                      max_size: Tuple[int, int] = None,
+                      original_size: Optional[int] = None) -> dict:
         """
         Compress an image using the specified method
         
         Args:
-            input_path: Path to input image
-            output_path: Path to save compressed image
+            input_source: Path to input image, its encoded bytes, or already
+                decoded pixels as a PIL image (used as-is and may be resized in
+                place) or a NumPy array in RGB(A) or grayscale layout
+            output_path: Path to save compressed image, or a writable binary
+                stream such as io.BytesIO
             method: Compression method to use
             quality: Quality setting (1-100)
             max_size: Maximum dimensions (width, height)
+            original_size: Encoded size of the input; required for decoded input
             
         Returns:
             Dictionary with compression results
         """
         try:
-            # Load image
-            with Image.open(input_path) as img:
-                original_size = os.path.getsize(input_path)
-                original_format = img.format
-                
-                # Apply compression method
-                if method in self.compression_methods:
-                    compressed_img = self.compression_methods[method](
-                        img, quality, max_size
-                    )
+            if isinstance(input_source, np.ndarray):
+                # Wraps the array's memory rather than copying it where possible
+                input_source = Image.fromarray(input_source)
+            
+            if original_size is None:
+                if isinstance(input_source, Image.Image):
+                    raise ValueError("original_size is required when passing decoded pixels")
+                elif isinstance(input_source, bytes):
+                    original_size = len(input_source)
                 else:
-                    compressed_img = self._compress_jpeg(img, quality, max_size)
-                
-                # Save compressed image
-                compressed_img.save(output_path, optimize=True)
-                compressed_size = os.path.getsize(output_path)
-                
-                # Calculate compression ratio
-                compression_ratio = (1 - compressed_size / original_size) * 100
-                
+                    original_size = os.path.getsize(input_source)
+            
+            # Streams are named by their file, if they have one
+            if isinstance(output_path, str):
+                output_name = output_path
+            else:
+                output_name = getattr(output_path, 'name', None)
+                output_name = output_name if isinstance(output_name, str) else None
+            
+            # Decoded images have no content digest to key the cache on
+            use_cache = self.cache_dir and not isinstance(input_source, Image.Image)
+            if use_cache:
+                if isinstance(input_source, bytes):
+                    digest = hashlib.sha256(input_source).hexdigest()
+                else:
+                    with open(input_source, 'rb') as f:
+                        if hasattr(hashlib, 'file_digest'):
+                            digest = hashlib.file_digest(f, 'sha256').hexdigest()
+                        else:
+                            digest = hashlib.sha256(f.read()).hexdigest()
+                key = self._cache_key(digest, self._output_format(method, output_name),
+                                      method, quality, max_size)
+                cached = self._cache_get(key)
+                if cached:
+                    result, artifact = cached
+                    if isinstance(output_path, str):
+                        shutil.copyfile(artifact, output_path)
+                    else:
+                        with open(artifact, 'rb') as f:
+                            shutil.copyfileobj(f, output_path)
+                    return result
+            
+            if isinstance(output_path, str):
+                result = self._compress(input_source, original_size, output_path, method, quality, max_size)
+                if use_cache:
+                    with open(output_path, 'rb') as f:
+                        self._cache_put(key, result, f.read())
+            else:
+                # Encode into a buffer of our own so the caller's stream
+                # needn't be seekable and only receives complete output
+                encoded = io.BytesIO()
+                result = self._compress(input_source, original_size, encoded, method, quality,
+                                        max_size, output_name=output_name)
+                output_path.write(encoded.getbuffer())
+                if use_cache:
+                    self._cache_put(key, result, encoded.getvalue())
+            return result
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def _compress_data(self, data: bytes, output_path: str, method: str, quality: int,
+                       max_size: Tuple[int, int]) -> Tuple[dict, Optional[bytes]]:
+        """
+        Compress an encoded image held in memory, returning (result, encoded output)
+        
+        output_path is only used to choose the output format; nothing is written.
+        """
+        if self.cache_dir:
+            key = self._cache_key(hashlib.sha256(data).hexdigest(),
+                                  self._output_format(method, output_path),
+                                  method, quality, max_size)
+            cached = self._cache_get(key)
+            if cached:
+                result, artifact = cached
+                with open(artifact, 'rb') as f:
+                    return result, f.read()
+        
+        output = io.BytesIO()
+        try:
+            result = self._compress(data, len(data), output, method, quality, max_size,
+                                    output_name=output_path)
+        except Exception as e:
+            return {'success': False, 'error': str(e)}, None
+        
+        if self.cache_dir:
+            self._cache_put(key, result, output.getvalue())
+        return result, output.getvalue()
+    
+    def _cache_key(self, digest: str, output_format: str, method: str, quality: int,
+                   max_size: Tuple[int, int]) -> str:
+        """Cache key for an input content digest and compression settings"""
+        params = repr((output_format, method, quality, tuple(max_size) if max_size else None))
+        return hashlib.sha256(f"{digest}:{params}".encode()).hexdigest()
+    
+    def _cache_get(self, key: str) -> Optional[Tuple[dict, str]]:
+        """Return the stored (result, artifact path) for a cache key, if any"""
+        artifact = os.path.join(self.cache_dir, key)
+        try:
+            with open(artifact + '.json', 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return (result, artifact) if os.path.exists(artifact) else None
+    
+    def _cache_put(self, key: str, result: dict, data: bytes):
+        """Store a compressed artifact and its result; cache errors are not fatal"""
+        artifact = os.path.join(self.cache_dir, key)
+        # Write to temporary names and rename so parallel workers never see
+        # partial entries; the result file goes last and marks the entry complete
+        tmp_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(artifact + tmp_suffix, 'wb') as f:
+                f.write(data)
+            os.replace(artifact + tmp_suffix, artifact)
+            with open(artifact + '.json' + tmp_suffix, 'w', encoding='utf-8') as f:
+                json.dump(result, f)
+            os.replace(artifact + '.json' + tmp_suffix, artifact + '.json')
+        except OSError:
+            pass
+    
+    def _output_format(self, method: str, output_path: Optional[str]) -> str:
+        """Format written by a method for the given output path"""
+        if (method == 'PNG Optimization' and self.prefer_webp_lossless
+                and not (output_path and output_path.lower().endswith('.png'))):
+            return 'WEBP'
+        return self.output_formats.get(method, 'JPEG')
+    
+    def _compress(self, source, original_size: int, output, method: str,
+                  quality: int, max_size: Tuple[int, int], output_name: Optional[str] = None) -> dict:
+        """
+        Compress from a path, encoded bytes or PIL image to a path or writable buffer
+        
+        output_name stands in for the output path when writing to a buffer.
+        
+        Raises on failure; compress_image turns errors into result dicts.
+        """
+        # Stream JPEG and WebP output through libvips when it is installed
+        if (pyvips is not None and method in ('JPEG Quality', 'WebP Conversion')
+                and not isinstance(source, Image.Image)):
+            try:
+                return self._compress_vips(source, original_size, output, method, quality, max_size)
+            except pyvips.Error:
+                pass  # Input not readable by libvips, fall back to Pillow
+        
+        # Load image; a decoded image belongs to the caller, so don't close it
+        with contextlib.ExitStack() as stack:
+            if isinstance(source, Image.Image):
+                img = source
+            elif isinstance(source, bytes):
+                img = stack.enter_context(Image.open(io.BytesIO(source)))
+            elif original_size > MMAP_THRESHOLD:
+                # Let the kernel page large files in on demand rather than
+                # copying them through stdio buffers
+                with open(source, 'rb') as f:
+                    mapped = stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                img = stack.enter_context(Image.open(mapped))
+            else:
+                img = stack.enter_context(Image.open(source))
+            
+            original_format = img.format
+            original_dims = img.size
+            
+            # A JPEG that already fits needs no resize; re-encoding it would
+            # only cost quality and time, so pass the original through
+            if (method == 'Size Reduction' and original_format == 'JPEG'
+                    and not isinstance(source, Image.Image)
+                    and (not max_size or (img.width <= max_size[0] and img.height <= max_size[1]))):
+                compressed_size = self._write_source(source, output)
                 return {
                     'success': True,
                     'original_size': original_size,
                     'compressed_size': compressed_size,
-                    'compression_ratio': compression_ratio,
+                    'compression_ratio': (1 - compressed_size / original_size) * 100,
                     'original_format': original_format,
-                    'output_format': compressed_img.format
+                    'output_format': 'JPEG'
                 }
-                
-        except Exception as e:
+            
+            # Apply compression method
+            if method in self.compression_methods:
+                compressed_img = self.compression_methods[method](
+                    img, quality, max_size
+                )
+            else:
+                compressed_img = self._compress_jpeg(img, quality, max_size)
+            
+            # Save with the encoder settings of the method's output format
+            output_format = self._output_format(method, output if isinstance(output, str) else output_name)
+            if output_format == 'PNG':
+                save_options = {'optimize': True, 'compress_level': 9}
+            elif method == 'PNG Optimization':
+                # Lossless WebP stands in for PNG
+                save_options = {'lossless': True, 'quality': 100, 'method': 6}
+            elif output_format == 'WEBP':
+                save_options = {'quality': quality, 'method': 6}
+            else:
+                save_options = {'quality': quality, 'progressive': True,
+                                'optimize': True, 'subsampling': 2}
+            
+            if isinstance(output, str):
+                try:
+                    with open(output, 'wb') as f:
+                        compressed_img.save(f, output_format, **save_options)
+                        f.flush()
+                        compressed_size = os.fstat(f.fileno()).st_size
+                except Exception:
+                    # Don't leave a truncated file behind
+                    os.remove(output)
+                    raise
+            else:
+                compressed_img.save(output, output_format, **save_options)
+                compressed_size = output.tell()
+            
+            # Re-encoding already compressed input can make it bigger; when
+            # the format and dimensions are unchanged the original is better
+            if (compressed_size > original_size and output_format == original_format
+                    and compressed_img.size == original_dims
+                    and not isinstance(source, Image.Image)):
+                compressed_size = self._write_source(source, output)
+            
+            # Calculate compression ratio
+            compression_ratio = (1 - compressed_size / original_size) * 100
+            
             return {
-                'success': False,
-                'error': str(e)
+                'success': True,
+                'original_size': original_size,
+                'compressed_size': compressed_size,
+                'compression_ratio': compression_ratio,
+                'original_format': original_format,
+                'output_format': output_format
             }
     
+    def _write_source(self, source, output) -> int:
+        """Write the encoded input unchanged to a path or buffer, returning its size"""
+        if isinstance(output, str):
+            if isinstance(source, bytes):
+                with open(output, 'wb') as f:
+                    f.write(source)
+            else:
+                shutil.copyfile(source, output)
+            return os.path.getsize(output)
+        
+        output.seek(0)
+        output.truncate()
+        if isinstance(source, bytes):
+            return output.write(source)
+        with open(source, 'rb') as f:
+            shutil.copyfileobj(f, output)
+        return output.tell()
+    
+    def _compress_vips(self, source, original_size: int, output, method: str,
+                       quality: int, max_size: Tuple[int, int]) -> dict:
+        """Compress to JPEG or WebP with libvips, bypassing Pillow entirely"""
+        output_format = self.output_formats.get(method, 'JPEG')
+        
+        # Opening is lazy; only the header is read here
+        if isinstance(source, bytes):
+            image = pyvips.Image.new_from_buffer(source, '', access='sequential')
+        else:
+            image = pyvips.Image.new_from_file(source, access='sequential')
+        # e.g. 'jpegload' or 'jpegload_buffer' -> 'JPEG', matching Pillow's format names
+        original_format = image.get('vips-loader').split('load')[0].upper()
+        original_dims = (image.width, image.height)
+        
+        if output_format == 'JPEG' and image.hasalpha():
+            # Drop alpha before resizing, as Image.convert('RGB') does, so
+            # transparent pixels keep their color instead of going black
+            image = image.extract_band(0, n=image.bands - 1)
+            if max_size:
+                image = image.thumbnail_image(max_size[0], height=max_size[1],
+                                              size='down', no_rotate=True)
+        elif max_size:
+            # thumbnail() shrinks on load and never upscales; keep EXIF
+            # orientation untouched like the Pillow path does
+            thumbnail = pyvips.Image.thumbnail_buffer if isinstance(source, bytes) else pyvips.Image.thumbnail
+            image = thumbnail(source, max_size[0], height=max_size[1], size='down', no_rotate=True)
+        
+        if output_format == 'WEBP':
+            saver, options = 'webpsave', {'Q': quality, 'effort': 6, 'strip': True}
+        else:
+            saver, options = 'jpegsave', {'Q': quality, 'strip': True, 'optimize_coding': True,
+                                          'interlace': True, 'subsample_mode': 'on'}
+        
+        if isinstance(output, str):
+            getattr(image, saver)(output, **options)
+            compressed_size = os.path.getsize(output)
+        else:
+            compressed_size = output.write(getattr(image, saver + '_buffer')(**options))
+        
+        # Keep the original when re-encoding only made it bigger
+        if (compressed_size > original_size and output_format == original_format
+                and (image.width, image.height) == original_dims):
+            compressed_size = self._write_source(source, output)
+        
+        return {
+            'success': True,
+            'original_size': original_size,
+            'compressed_size': compressed_size,
+            'compression_ratio': (1 - compressed_size / original_size) * 100,
+            'original_format': original_format,
+            'output_format': output_format
+        }
+    
+    def find_images(self, folder: str, recursive: bool = True) -> List[str]:
+        """
+        Collect supported image files in a folder
+        
+        Args:
+            folder: Directory to scan
+            recursive: Whether to descend into subdirectories
+            
+        Returns:
+            List of image file paths
+        """
+        images = []
+        subdirs = []
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(self.supported_formats):
+                        images.append(entry.path)
+        except OSError:
+            # Skip unreadable folders, as os.walk does
+            return images
+        
+        if recursive:
+            for subdir in subdirs:
+                images.extend(self.find_images(subdir))
+        
+        return images
+    
+    def get_output_path(self, input_path: str, output_dir: str, method: str,
+                        input_root: Optional[str] = None) -> str:
+        """
+        Build the output file path for an input image and compression method
+        
+        Args:
+            input_path: Path to input image
+            output_dir: Directory for compressed images
+            method: Compression method to use
+            input_root: Folder the input was found in; its subfolders are
+                recreated under output_dir so same-named files do not collide
+            
+        Returns:
+            Output file path
+        """
+        name, ext = os.path.splitext(os.path.basename(input_path))
+        
+        if input_root:
+            rel_dir = os.path.dirname(os.path.relpath(input_path, input_root))
+            if rel_dir:
+                output_dir = os.path.join(output_dir, rel_dir)
+                os.makedirs(output_dir, exist_ok=True)
+        
+        # Determine output format based on compression method
+        output_format = self._output_format(method, None)
+        if output_format == 'WEBP':
+            output_ext = ".webp"
+        elif output_format == 'PNG':
+            output_ext = ".png"
+        else:
+            output_ext = ".jpg"
+        
+        return os.path.join(output_dir, f"{name}_compressed{output_ext}")
+    
+    def compress_batch(self, tasks: List[tuple], max_workers: Optional[int] = None):
+        """
+        Compress many images, overlapping disk I/O with compression
+        
+        A reader thread loads the next inputs while the current ones are
+        compressed (in a process pool when more than one worker is used),
+        and a writer thread saves finished outputs.
+        
+        Args:
+            tasks: List of (input_path, output_path, method, quality, max_size) tuples
+            max_workers: Number of worker processes (defaults to the CPU count)
+            
+        Yields:
+            (task, result) pairs in task order
+        """
+        # A single file has nothing to overlap with
+        if len(tasks) == 1:
+            yield tasks[0], self.compress_image(*tasks[0])
+            return
+        
+        workers = max_workers or os.cpu_count() or 1
+        executor = None
+        if workers > 1:
+            # Spawn fresh workers: forking after libvips/OpenCV started their
+            # thread pools (or from a Tk worker thread) can deadlock the children
+            executor = ProcessPoolExecutor(max_workers=workers,
+                                           mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=_init_worker,
+                                           initargs=(self,))
+        
+        stop = threading.Event()
+        inputs = queue.Queue(maxsize=4)             # (task, bytes) read ahead of compression
+        pending = queue.Queue(maxsize=2 * workers)  # (task, future) in task order
+        done = queue.Queue()                        # (task, result) ready for the caller
+        
+        def put(q, item):
+            # Give up once the caller has stopped consuming results
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        
+        def get(q):
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return None
+        
+        def read_inputs():
+            for task in tasks:
+                try:
+                    with open(task[0], 'rb') as f:
+                        data = f.read()
+                except OSError as e:
+                    data = e
+                if not put(inputs, (task, data)):
+                    return
+        
+        def compress_inputs():
+            for _ in tasks:
+                item = get(inputs)
+                if item is None:
+                    return
+                task, data = item
+                future = Future()
+                try:
+                    if isinstance(data, OSError):
+                        future.set_result(({'success': False, 'error': str(data)}, None))
+                    elif executor is not None:
+                        future = executor.submit(_compress_one, data, *task[1:])
+                    else:
+                        future.set_result(self._compress_data(data, *task[1:]))
+                except Exception as e:
+                    future.set_exception(e)
+                if not put(pending, (task, future)):
+                    return
+        
+        def write_outputs():
+            for _ in tasks:
+                item = get(pending)
+                if item is None:
+                    return
+                task, future = item
+                try:
+                    result, data = future.result()
+                    if data is not None:
+                        try:
+                            with open(task[1], 'wb') as f:
+                                f.write(data)
+                        except OSError:
+                            # Don't leave a truncated file behind
+                            if os.path.exists(task[1]):
+                                os.remove(task[1])
+                            raise
+                except Exception as e:
+                    result = {'success': False, 'error': str(e)}
+                done.put((task, result))
+        
+        threads = [threading.Thread(target=target, daemon=True)
+                   for target in (read_inputs, compress_inputs, write_outputs)]
+        for thread in threads:
+            thread.start()
+        
+        try:
+            for _ in tasks:
+                yield done.get()
+        finally:
+            stop.set()
+            if executor is not None:
+                executor.shutdown(wait=False)
+    
     def _compress_jpeg(self, img: Image.Image, quality: int, max_size: Tuple[int, int]) -> Image.Image:
         """Compress using JPEG quality reduction"""
         if img.mode in ('RGBA', 'LA', 'P'):
             img = img.convert('RGB')
         
         if max_size:
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+            img.thumbnail(max_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
         
         return img
     
     def _compress_png(self, img: Image.Image, quality: int, max_size: Tuple[int, int]) -> Image.Image:
         """Compress PNG using optimization"""
         if max_size:
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+            img.thumbnail(max_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        
+        # Lossless WebP keeps transparency at no extra cost
+        if self.prefer_webp_lossless:
+            return img
         
         # Convert to RGB if necessary for better compression
         if img.mode == 'RGBA':
-            # Create white background
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            background.paste(img, mask=img.split()[-1])
-            img = background
+            # Composite onto a white background in one pass
+            background = Image.new('RGBA', img.size, (255, 255, 255, 255))
+            img = Image.alpha_composite(background, img).convert('RGB')
         
         return img
     
     def _compress_webp(self, img: Image.Image, quality: int, max_size: Tuple[int, int]) -> Image.Image:
         """Convert to WebP format"""
         if max_size:
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+            img.thumbnail(max_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
         
         if img.mode in ('RGBA', 'LA'):
             pass  # Keep transparency
@@ -121,7 +634,7 @@ class ImageCompressor:
     def _compress_resize(self, img: Image.Image, quality: int, max_size: Tuple[int, int]) -> Image.Image:
         """Compress by resizing"""
         if max_size:
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+            img.thumbnail(max_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
         
         # Convert to RGB for JPEG compression
         if img.mode in ('RGBA', 'LA', 'P'):
@@ -131,8 +644,23 @@ class ImageCompressor:
     
     def _compress_advanced_lossy(self, img: Image.Image, quality: int, max_size: Tuple[int, int]) -> Image.Image:
         """Advanced lossy compression using OpenCV"""
-        # Convert PIL to OpenCV format
-        cv_img = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+        # Without a blur pass OpenCV adds nothing over the plain JPEG path
+        if quality >= 70:
+            return self._compress_jpeg(img, quality, max_size)
+        
+        # No thumbnail() here to draft for us, so let libjpeg decode at a
+        # reduced scale before the image becomes a NumPy array
+        if max_size and img.format == 'JPEG':
+            img.draft('RGB', max_size)
+        
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        # Resize and blur are channel-order agnostic, so work on the RGB array directly.
+        # The array holds its own copy of the pixels, so drop our image reference
+        # (a converted copy is freed here; the caller still owns the original)
+        cv_img = np.asarray(img)
+        del img
         
         if max_size:
             height, width = cv_img.shape[:2]
@@ -142,22 +670,23 @@ class ImageCompressor:
                 scale = min(max_w/width, max_h/height)
                 new_width = int(width * scale)
                 new_height = int(height * scale)
+                # Rebinding releases the full-size array as soon as the resize is done
                 cv_img = cv2.resize(cv_img, (new_width, new_height), interpolation=cv2.INTER_AREA)
         
-        # Apply Gaussian blur for additional compression
-        if quality < 70:
-            kernel_size = max(1, int((100 - quality) / 20))
-            if kernel_size % 2 == 0:
-                kernel_size += 1
-            cv_img = cv2.GaussianBlur(cv_img, (kernel_size, kernel_size), 0)
-        
-        # Convert back to PIL
-        img = Image.fromarray(cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB))
+        # Blur for additional compression; a 1x1 kernel would be a no-op
+        kernel_size = max(1, int((100 - quality) / 20)) | 1
+        if kernel_size > 1:
+            # Blur in place on our own resized buffer; the unresized array
+            # is a read-only view of Pillow's bytes and needs a new one
+            dst = cv_img if cv_img.flags.writeable else None
+            if kernel_size >= 5:
+                # A box filter costs the same at any kernel size and smooths
+                # away as much detail for the JPEG encoder
+                cv_img = cv2.boxFilter(cv_img, -1, (kernel_size, kernel_size), dst=dst)
+            else:
+                cv_img = cv2.GaussianBlur(cv_img, (kernel_size, kernel_size), 0, dst=dst)
         
-        if img.mode in ('RGBA', 'LA', 'P'):
-            img = img.convert('RGB')
-        
-        return img
+        return Image.fromarray(cv_img)
 
 class ImageCompressorGUI:
     """Modern GUI for the image compressor"""
@@ -178,6 +707,7 @@ class ImageCompressorGUI:
         
         # Variables
         self.input_files = []
+        self.input_root = None
         self.output_dir = ""
         self.compression_method = tk.StringVar(value="JPEG Quality")
         self.quality = tk.IntVar(value=85)
@@ -185,8 +715,15 @@ class ImageCompressorGUI:
         self.max_height = tk.IntVar(value=1080)
         self.batch_mode = tk.BooleanVar(value=False)
         
+        # Worker thread -> Tk handoff; drained on a timer instead of one
+        # after() callback per update. Only the latest progress matters.
+        self._result_queue = queue.Queue()
+        self._progress = None
+        self._finished = False
+        
         # Create GUI elements
         self.create_widgets()
+        self.root.after(100, self._drain)
         
     def create_widgets(self):
         """Create and arrange GUI widgets"""
@@ -348,17 +885,15 @@ class ImageCompressorGUI:
         )
         if files:
             self.input_files = list(files)
+            self.input_root = None
             self.update_file_list()
     
     def select_folder(self):
         """Select folder containing images"""
         folder = filedialog.askdirectory(title="Select Folder with Images")
         if folder:
-            self.input_files = []
-            for root, dirs, files in os.walk(folder):
-                for file in files:
-                    if any(file.lower().endswith(ext) for ext in self.compressor.supported_formats):
-                        self.input_files.append(os.path.join(root, file))
+            self.input_files = self.compressor.find_images(folder)
+            self.input_root = folder
             self.update_file_list()
     
     def update_file_list(self):
@@ -387,6 +922,8 @@ class ImageCompressorGUI:
         
         # Disable compress button during processing
         self.compress_btn.configure(state="disabled")
+        self.results_text.delete(1.0, tk.END)
+        self.results_text.insert(tk.END, "Starting compression...\n\n")
         
         # Start compression in a separate thread
         thread = threading.Thread(target=self.compress_images)
@@ -401,41 +938,26 @@ class ImageCompressorGUI:
         total_original_size = 0
         total_compressed_size = 0
         
-        self.results_text.delete(1.0, tk.END)
-        self.results_text.insert(tk.END, "Starting compression...\n\n")
+        # Read settings once; worker processes cannot touch Tk variables
+        method = self.compression_method.get()
+        quality = self.quality.get()
+        max_size = (self.max_width.get(), self.max_height.get())
         
-        for i, input_path in enumerate(self.input_files):
-            try:
+        tasks = [
+            (input_path,
+             self.compressor.get_output_path(input_path, self.output_dir, method, self.input_root),
+             method, quality, max_size)
+            for input_path in self.input_files
+        ]
+        
+        try:
+            results = self.compressor.compress_batch(tasks)
+            for i, (task, result) in enumerate(results):
+                filename = os.path.basename(task[0])
+                
                 # Update progress
                 progress = (i + 1) / total_files
-                self.root.after(0, lambda p=progress: self.progress_bar.set(p))
-                self.root.after(0, lambda i=i, t=total_files: 
-                    self.progress_label.configure(text=f"Processing {i+1}/{t}"))
-                
-                # Generate output filename
-                filename = os.path.basename(input_path)
-                name, ext = os.path.splitext(filename)
-                
-                # Determine output format based on compression method
-                method = self.compression_method.get()
-                if method == "WebP Conversion":
-                    output_ext = ".webp"
-                elif method == "PNG Optimization":
-                    output_ext = ".png"
-                else:
-                    output_ext = ".jpg"
-                
-                output_filename = f"{name}_compressed{output_ext}"
-                output_path = os.path.join(self.output_dir, output_filename)
-                
-                # Compress image
-                result = self.compressor.compress_image(
-                    input_path,
-                    output_path,
-                    method,
-                    self.quality.get(),
-                    (self.max_width.get(), self.max_height.get())
-                )
+                self._progress = (progress, f"Processing {i+1}/{total_files}")
                 
                 if result['success']:
                     successful += 1
@@ -444,23 +966,20 @@ class ImageCompressorGUI:
                     
                     # Add result to text area
                     result_text = f"✓ {filename}\n"
-                    result_text += f"  Original: {self.format_size(result['original_size'])}\n"
-                    result_text += f"  Compressed: {self.format_size(result['compressed_size'])}\n"
+                    result_text += f"  Original: {format_size(result['original_size'])}\n"
+                    result_text += f"  Compressed: {format_size(result['compressed_size'])}\n"
                     result_text += f"  Compression: {result['compression_ratio']:.1f}%\n\n"
                     
-                    self.root.after(0, lambda text=result_text: 
-                        self.results_text.insert(tk.END, text))
+                    self._result_queue.put(result_text)
                 else:
                     failed += 1
                     error_text = f"✗ {filename} - Error: {result['error']}\n\n"
-                    self.root.after(0, lambda text=error_text: 
-                        self.results_text.insert(tk.END, text))
+                    self._result_queue.put(error_text)
                 
-            except Exception as e:
-                failed += 1
-                error_text = f"✗ {filename} - Error: {str(e)}\n\n"
-                self.root.after(0, lambda text=error_text: 
-                    self.results_text.insert(tk.END, text))
+        except Exception as e:
+            failed = total_files - successful
+            error_text = f"✗ Batch failed - Error: {str(e)}\n\n"
+            self._result_queue.put(error_text)
         
         # Final results
         total_compression_ratio = 0
@@ -470,29 +989,38 @@ class ImageCompressorGUI:
         final_text = f"\n=== COMPRESSION COMPLETE ===\n"
         final_text += f"Successful: {successful}\n"
         final_text += f"Failed: {failed}\n"
-        final_text += f"Total original size: {self.format_size(total_original_size)}\n"
-        final_text += f"Total compressed size: {self.format_size(total_compressed_size)}\n"
+        final_text += f"Total original size: {format_size(total_original_size)}\n"
+        final_text += f"Total compressed size: {format_size(total_compressed_size)}\n"
         final_text += f"Overall compression: {total_compression_ratio:.1f}%\n"
         
-        self.root.after(0, lambda text=final_text: 
-            self.results_text.insert(tk.END, text))
+        self._result_queue.put(final_text)
         
-        # Re-enable compress button
-        self.root.after(0, lambda: self.compress_btn.configure(state="normal"))
-        self.root.after(0, lambda: self.progress_label.configure(text="Compression complete"))
+        # Re-enable compress button on the next drain
+        self._finished = True
     
-    def format_size(self, size_bytes):
-        """Format file size in human readable format"""
-        if size_bytes == 0:
-            return "0 B"
-        
-        size_names = ["B", "KB", "MB", "GB"]
-        i = 0
-        while size_bytes >= 1024 and i < len(size_names) - 1:
-            size_bytes /= 1024.0
-            i += 1
-        
-        return f"{size_bytes:.1f} {size_names[i]}"
+    def _drain(self):
+        """Move queued results and the latest progress into the widgets"""
+        try:
+            lines = []
+            try:
+                while True:
+                    lines.append(self._result_queue.get_nowait())
+            except queue.Empty:
+                pass
+            if lines:
+                self.results_text.insert(tk.END, "".join(lines))
+            
+            progress, self._progress = self._progress, None
+            if progress is not None:
+                self.progress_bar.set(progress[0])
+                self.progress_label.configure(text=progress[1])
+            
+            if self._finished and self._result_queue.empty():
+                self._finished = False
+                self.compress_btn.configure(state="normal")
+                self.progress_label.configure(text="Compression complete")
+        finally:
+            self.root.after(100, self._drain)
     
     def run(self):
         """Start the GUI application"""
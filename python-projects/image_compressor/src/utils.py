@@ -0,0 +1,15 @@
+"""
+Shared helpers for the Image Compressor GUI and CLI
+"""
+
+import math
+
+SIZE_NAMES = ("B", "KB", "MB", "GB")
+
+def format_size(size_bytes):
+    """Format file size in human readable format"""
+    if size_bytes <= 0:
+        return "0 B"
+    
+    i = min(len(SIZE_NAMES) - 1, int(math.log(size_bytes, 1024)))
+    return f"{size_bytes / 1024 ** i:.1f} {SIZE_NAMES[i]}"
@@ -3,74 +3,170 @@ Test suite for Image Compressor
 """
 
 import unittest
+import io
 import os
+import struct
 import tempfile
-from PIL import Image
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from PIL import Image, UnidentifiedImageError
 import numpy as np
+from src import image_compressor
 from src.image_compressor import ImageCompressor
+from src.utils import format_size
+
+# Start-of-frame markers carry the dimensions (baseline, extended, progressive, ...)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def _jpeg_dim(data):
+    """Return (height, width) from a JPEG's frame header without decoding it"""
+    i = 2  # Skip SOI
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            raise ValueError("not a JPEG marker")
+        marker = data[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            return struct.unpack('>HH', data[i + 5:i + 9])
+        i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+    raise ValueError("no JPEG frame header found")
 
 class TestImageCompressor(unittest.TestCase):
     
-    def setUp(self):
-        """Set up test fixtures"""
-        self.compressor = ImageCompressor()
-        self.temp_dir = tempfile.mkdtemp()
+    @classmethod
+    def setUpClass(cls):
+        """Set up the shared, read-only fixtures once for all tests"""
+        # Stateless without a cache dir, so one instance serves every test;
+        # tests needing other options build their own
+        cls.compressor = ImageCompressor()
         
-        # Create a test image
-        self.test_image_path = os.path.join(self.temp_dir, "test.jpg")
-        self.create_test_image()
+        cls._buf = np.full((100, 100, 3), (255, 0, 0), dtype=np.uint8)
+        # Keep test file I/O in RAM where a tmpfs is available
+        shm = '/dev/shm' if os.access('/dev/shm', os.W_OK) else None
+        cls.temp_dir = tempfile.mkdtemp(dir=shm)
+        # Everything created under temp_dir, and the outputs tests expect to
+        # find there; both are checked and removed once in tearDownClass
+        cls._created = []
+        cls._outputs = []
+        
+        # Create a test image, in memory and on disk for the path-based APIs
+        cls.test_image_path = os.path.join(cls.temp_dir, "test.bmp")
+        cls.create_test_image()
+    
+    def temp_path(self, *parts):
+        """Path under the shared temp dir, removed again in tearDownClass"""
+        path = os.path.join(self.temp_dir, *parts)
+        self._created.append(path)
+        return path
     
-    def create_test_image(self):
+    @classmethod
+    def create_test_image(cls):
         """Create a test image for compression tests"""
-        # Create a simple test image
-        img = Image.new('RGB', (100, 100), color='red')
-        img.save(self.test_image_path, 'JPEG', quality=95)
+        # Wrap the cached pixels without copying them; BMP stores them as-is,
+        # leaving the compressor's decode and encode as the only codec work
+        img = Image.frombuffer('RGB', (100, 100), cls._buf, 'raw', 'RGB', 0, 1)
+        buf = io.BytesIO()
+        img.save(buf, 'BMP')
+        cls.test_image_data = buf.getvalue()
+        with open(cls.test_image_path, 'wb') as f:
+            f.write(cls.test_image_data)
+        
+        # Decode once for tests that compress the same pixels repeatedly
+        with Image.open(buf) as decoded:
+            cls._decoded = np.asarray(decoded.convert('RGB'))
     
     def test_compression_methods(self):
         """Test all compression methods"""
-        methods = self.compressor.compression_methods.keys()
+        pairs = [(method, io.BytesIO()) for method in self.compressor.compression_methods]
+        
+        # Each method writes its own buffer and the codecs release the GIL
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+            results = list(ex.map(
+                lambda pair: self.compressor.compress_image(
+                    self.test_image_data, pair[1], pair[0], quality=80),
+                pairs))
         
-        for method in methods:
+        for (method, output), result in zip(pairs, results):
             with self.subTest(method=method):
-                output_path = os.path.join(self.temp_dir, f"test_{method.lower().replace(' ', '_')}.jpg")
-                
-                result = self.compressor.compress_image(
-                    self.test_image_path,
-                    output_path,
-                    method,
-                    quality=80
-                )
-                
                 self.assertTrue(result['success'], f"Method {method} failed")
                 self.assertGreater(result['compression_ratio'], 0)
-                self.assertTrue(os.path.exists(output_path))
+                self.assertEqual(len(output.getvalue()), result['compressed_size'])
     
     def test_quality_settings(self):
         """Test different quality settings"""
-        qualities = [50, 70, 85, 95]
+        pairs = [(quality, io.BytesIO()) for quality in [50, 70, 85, 95]]
         
-        for quality in qualities:
+        # Compress the pre-decoded pixels instead of decoding the fixture per quality
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+            results = list(ex.map(
+                lambda pair: self.compressor.compress_image(
+                    self._decoded, pair[1], 'JPEG Quality', quality=pair[0],
+                    original_size=len(self.test_image_data)),
+                pairs))
+        
+        for (quality, output), result in zip(pairs, results):
             with self.subTest(quality=quality):
-                output_path = os.path.join(self.temp_dir, f"test_q{quality}.jpg")
-                
-                result = self.compressor.compress_image(
-                    self.test_image_path,
-                    output_path,
-                    'JPEG Quality',
-                    quality=quality
-                )
-                
                 self.assertTrue(result['success'])
-                self.assertTrue(os.path.exists(output_path))
+                self.assertEqual(len(output.getvalue()), result['compressed_size'])
     
+    def test_quality_reduces_size(self):
+        """Test that a lower quality setting produces a smaller file"""
+        noise_path = self.temp_path("noise.png")
+        pixels = np.random.default_rng(0).integers(0, 256, (100, 100, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(noise_path, 'PNG')
+
+        sizes = []
+        for quality in (30, 90):
+            output_path = self.temp_path(f"noise_q{quality}.jpg")
+            result = self.compressor.compress_image(noise_path, output_path, 'JPEG Quality', quality)
+            self.assertTrue(result['success'])
+            sizes.append(result['compressed_size'])
+
+        self.assertLess(sizes[0], sizes[1])
+
+    def test_output_format_follows_method(self):
+        """Test that the written format follows the method"""
+        expected = {
+            'JPEG Quality': 'JPEG',
+            'PNG Optimization': 'PNG',
+            'WebP Conversion': 'WEBP',
+            'Size Reduction': 'JPEG',
+        }
+
+        for method, output_format in expected.items():
+            with self.subTest(method=method):
+                output = io.BytesIO()
+                result = self.compressor.compress_image(self.test_image_data, output, method)
+
+                self.assertTrue(result['success'])
+                self.assertEqual(result['output_format'], output_format)
+                output.seek(0)
+                with Image.open(output) as img:
+                    self.assertEqual(img.format, output_format)
+
+    def test_failed_save_removes_output(self):
+        """Test that a failed encode does not leave a partial output file"""
+        input_path = self.temp_path("deep.png")
+        Image.new('I;16', (10, 10)).save(input_path, 'PNG')
+        output_path = self.temp_path("deep_out.jpg")
+
+        result = self.compressor.compress_image(input_path, output_path, 'Size Reduction')
+
+        self.assertFalse(result['success'])
+        self.assertFalse(os.path.exists(output_path))
+
     def test_size_reduction(self):
         """Test size reduction functionality"""
         max_size = (50, 50)
-        output_path = os.path.join(self.temp_dir, "test_resized.jpg")
+        output = io.BytesIO()
         
         result = self.compressor.compress_image(
-            self.test_image_path,
-            output_path,
+            self.test_image_data,
+            output,
             'Size Reduction',
             quality=85,
             max_size=max_size
@@ -79,33 +175,353 @@ class TestImageCompressor(unittest.TestCase):
         self.assertTrue(result['success'])
         
         # Check if image was actually resized
+        height, width = _jpeg_dim(output.getvalue())
+        self.assertLessEqual(width, max_size[0])
+        self.assertLessEqual(height, max_size[1])
+
+    def test_size_reduction_passes_through_fitting_jpeg(self):
+        """Test that a JPEG within max_size is copied, not re-encoded"""
+        input_path = self.temp_path("fitting.jpg")
+        Image.fromarray(self._decoded).save(input_path, 'JPEG', quality=95)
+        output_path = self.temp_path("passthrough.jpg")
+
+        result = self.compressor.compress_image(
+            input_path, output_path, 'Size Reduction', 50, (200, 200))
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['compression_ratio'], 0)
+        with open(input_path, 'rb') as a, open(output_path, 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+
+    def test_larger_output_keeps_original(self):
+        """Test that re-encoding which grows the file keeps the original instead"""
+        input_path = self.temp_path("low_quality.jpg")
+        pixels = np.random.default_rng(0).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(input_path, 'JPEG', quality=20)
+        output_path = self.temp_path("low_quality_out.jpg")
+
+        for use_vips in (True, False):
+            with self.subTest(use_vips=use_vips):
+                pyvips = image_compressor.pyvips if use_vips else None
+                with patch.object(image_compressor, 'pyvips', pyvips):
+                    result = self.compressor.compress_image(input_path, output_path, 'JPEG Quality', 95)
+
+                self.assertTrue(result['success'])
+                self.assertEqual(result['compressed_size'], result['original_size'])
+                with open(input_path, 'rb') as a, open(output_path, 'rb') as b:
+                    self.assertEqual(a.read(), b.read())
+
+    def test_large_input_is_memory_mapped(self):
+        """Test that inputs above MMAP_THRESHOLD are read through mmap"""
+        output_path = self.temp_path("mapped.png")
+
+        with patch.object(image_compressor, 'MMAP_THRESHOLD', 0), \
+                patch.object(image_compressor.mmap, 'mmap', wraps=image_compressor.mmap.mmap) as mapped:
+            result = self.compressor.compress_image(self.test_image_path, output_path,
+                                                    'PNG Optimization', max_size=(50, 50))
+
+        self.assertTrue(result['success'])
+        mapped.assert_called_once()
         with Image.open(output_path) as img:
-            self.assertLessEqual(img.width, max_size[0])
-            self.assertLessEqual(img.height, max_size[1])
-    
+            self.assertEqual(img.size, (50, 50))
+
+    def test_advanced_lossy_blur_levels(self):
+        """Test Advanced Lossy at qualities that skip, Gaussian- and box-blur"""
+        for quality in (65, 50, 10):
+            with self.subTest(quality=quality):
+                output_path = self.temp_path(f"lossy_q{quality}.jpg")
+                result = self.compressor.compress_image(
+                    self.test_image_path, output_path, 'Advanced Lossy', quality, (40, 40))
+
+                self.assertTrue(result['success'])
+                with Image.open(output_path) as img:
+                    self.assertEqual(img.size, (40, 40))
+
+    def test_bytes_and_image_input(self):
+        """Test compressing encoded bytes and an already decoded image"""
+        with open(self.test_image_path, 'rb') as f:
+            data = f.read()
+
+        bytes_path = self.temp_path("from_bytes.jpg")
+        result = self.compressor.compress_image(data, bytes_path, 'JPEG Quality', 80)
+        self.assertTrue(result['success'])
+        self.assertEqual(result['original_size'], len(data))
+        self.assertEqual(result['original_format'], 'BMP')
+
+        image_path = self.temp_path("from_image.webp")
+        with Image.open(self.test_image_path) as img:
+            img.load()
+            result = self.compressor.compress_image(img, image_path, 'WebP Conversion', 80,
+                                                    original_size=len(data))
+            self.assertTrue(result['success'])
+            self.assertEqual(result['original_size'], len(data))
+
+            # The encoded size can't be recovered from a decoded image
+            result = self.compressor.compress_image(img, image_path, 'WebP Conversion', 80)
+            self.assertFalse(result['success'])
+
+        with Image.open(image_path) as img:
+            self.assertEqual(img.format, 'WEBP')
+
+    def test_batch_compression(self):
+        """Test parallel batch compression"""
+        tasks = [
+            (self.test_image_path, self.temp_path(f"batch_{i}.jpg"),
+             'JPEG Quality', 80, None)
+            for i in range(3)
+        ]
+
+        # Compress in this process first so any codec thread pools exist
+        # before the worker pool starts
+        warmup = self.compressor.compress_image(
+            self.test_image_path, self.temp_path("warmup.jpg"))
+        self.assertTrue(warmup['success'])
+
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                results = list(self.compressor.compress_batch(tasks, max_workers=workers))
+
+                self.assertEqual([task for task, _ in results], tasks)
+                for task, result in results:
+                    self.assertTrue(result['success'])
+                    self.assertEqual(os.path.getsize(task[1]), result['compressed_size'])
+
+    def test_batch_reports_unreadable_input(self):
+        """Test that a missing input fails only its own batch entry"""
+        tasks = [
+            (self.temp_path("missing.jpg"),
+             self.temp_path("missing_out.jpg"), 'JPEG Quality', 80, None),
+            (self.test_image_path,
+             self.temp_path("present_out.jpg"), 'JPEG Quality', 80, None),
+        ]
+
+        results = [result for _, result in self.compressor.compress_batch(tasks, max_workers=1)]
+
+        self.assertFalse(results[0]['success'])
+        self.assertIn('missing.jpg', results[0]['error'])
+        self.assertFalse(os.path.exists(tasks[0][1]))
+        self.assertTrue(results[1]['success'])
+
+    def test_abandoned_batch_stops_threads(self):
+        """Test that closing a batch early stops its pipeline threads"""
+        threads_before = threading.active_count()
+        tasks = [
+            (self.test_image_path, self.temp_path(f"early_{i}.jpg"),
+             'JPEG Quality', 80, None)
+            for i in range(20)
+        ]
+
+        batch = self.compressor.compress_batch(tasks, max_workers=1)
+        next(batch)
+        batch.close()
+
+        deadline = time.monotonic() + 5
+        while threading.active_count() > threads_before and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(threading.active_count(), threads_before)
+
+    def test_output_path_keeps_subfolders(self):
+        """Test same-named images in different subfolders get distinct outputs"""
+        input_root = self.temp_path("in")
+        output_dir = self.temp_path("out")
+        first = self.compressor.get_output_path(
+            os.path.join(input_root, "a", "photo.png"), output_dir, 'JPEG Quality', input_root)
+        second = self.compressor.get_output_path(
+            os.path.join(input_root, "b", "photo.png"), output_dir, 'JPEG Quality', input_root)
+
+        self._created.extend([os.path.dirname(first), os.path.dirname(second)])
+
+        self.assertEqual(first, os.path.join(output_dir, "a", "photo_compressed.jpg"))
+        self.assertEqual(second, os.path.join(output_dir, "b", "photo_compressed.jpg"))
+        self.assertTrue(os.path.isdir(os.path.dirname(first)))
+
+    def test_find_images(self):
+        """Test folder scanning for supported images"""
+        # Scan a folder of its own; the shared temp dir fills with other tests' outputs
+        scan_dir = self.temp_path("scan")
+        nested_dir = self.temp_path("scan", "nested")
+        os.makedirs(nested_dir)
+        top_image = self.temp_path("scan", "top.jpg")
+        Image.new('RGB', (10, 10)).save(top_image, 'JPEG')
+        nested_image = self.temp_path("scan", "nested", "nested.PNG")
+        Image.new('RGB', (10, 10)).save(nested_image, 'PNG')
+        with open(self.temp_path("scan", "notes.txt"), 'w') as f:
+            f.write("not an image")
+
+        self.assertEqual(self.compressor.find_images(scan_dir, recursive=False), [top_image])
+        self.assertEqual(sorted(self.compressor.find_images(scan_dir)),
+                         sorted([top_image, nested_image]))
+
+    def test_find_images_skips_unreadable_folder(self):
+        """Test that folders that cannot be listed are skipped"""
+        missing_dir = self.temp_path("missing")
+
+        self.assertEqual(self.compressor.find_images(missing_dir), [])
+
+    def create_transparent_image(self):
+        """Create a PNG whose pixels are fully transparent red"""
+        path = self.temp_path("transparent.png")
+        Image.new('RGBA', (20, 20), (255, 0, 0, 0)).save(path, 'PNG')
+        return path
+
+    def check_jpeg_and_webp(self):
+        """Compress a transparent PNG to JPEG and WebP and check the results"""
+        input_path = self.create_transparent_image()
+
+        jpeg_path = self.temp_path("transparent.jpg")
+        result = self.compressor.compress_image(input_path, jpeg_path, 'JPEG Quality', 90, (10, 10))
+        self.assertTrue(result['success'])
+        self.assertEqual(result['original_format'], 'PNG')
+        with Image.open(jpeg_path) as img:
+            self.assertEqual(img.size, (10, 10))
+            red, green, blue = img.convert('RGB').getpixel((5, 5))
+            self.assertGreater(red, 200)
+            self.assertLess(green + blue, 50)
+
+        webp_path = self.temp_path("transparent.webp")
+        result = self.compressor.compress_image(input_path, webp_path, 'WebP Conversion', 90)
+        self.assertTrue(result['success'])
+        with Image.open(webp_path) as img:
+            self.assertEqual(img.format, 'WEBP')
+            self.assertIn('A', img.getbands())
+
+    @unittest.skipUnless(image_compressor.pyvips, "pyvips not installed")
+    def test_vips_path(self):
+        """Test the libvips JPEG/WebP path"""
+        self.check_jpeg_and_webp()
+
+    def test_pillow_path(self):
+        """Test the Pillow JPEG/WebP path used without libvips"""
+        with patch.object(image_compressor, 'pyvips', None):
+            self.check_jpeg_and_webp()
+
+    @unittest.skipUnless(image_compressor.pyvips, "pyvips not installed")
+    def test_vips_error_falls_back_to_pillow(self):
+        """Test that inputs libvips rejects are compressed with Pillow"""
+        output_path = self.temp_path("fallback.jpg")
+        vips_error = image_compressor.pyvips.Error("unsupported input")
+
+        with patch.object(ImageCompressor, '_compress_vips', side_effect=vips_error):
+            result = self.compressor.compress_image(self.test_image_path, output_path)
+
+        self.assertTrue(result['success'])
+        self._outputs.append(output_path)
+
+    def test_cache_reuses_results(self):
+        """Test that cached results are reused for unchanged inputs and settings"""
+        compressor = ImageCompressor(cache_dir=self.temp_path("cache"))
+        first_path = self.temp_path("cached_1.jpg")
+        second_path = self.temp_path("cached_2.jpg")
+
+        first = compressor.compress_image(self.test_image_path, first_path, 'JPEG Quality', 70)
+        with patch.object(ImageCompressor, '_compress', side_effect=AssertionError("not cached")):
+            second = compressor.compress_image(self.test_image_path, second_path, 'JPEG Quality', 70)
+            stream = io.BytesIO()
+            streamed = compressor.compress_image(self.test_image_path, stream, 'JPEG Quality', 70)
+            batch = list(compressor.compress_batch([
+                (self.test_image_path, self.temp_path(f"cached_batch_{i}.jpg"),
+                 'JPEG Quality', 70, None)
+                for i in range(2)
+            ], max_workers=1))
+
+        self.assertEqual(first, second)
+        self.assertEqual(first, streamed)
+        with open(first_path, 'rb') as a, open(second_path, 'rb') as b:
+            first_data = a.read()
+            self.assertEqual(first_data, b.read())
+        self.assertEqual(first_data, stream.getvalue())
+        for _, result in batch:
+            self.assertEqual(result, first)
+
+        # Different settings are not served from the cache
+        other = compressor.compress_image(self.test_image_path, second_path, 'JPEG Quality', 40)
+        self.assertNotEqual(other['compressed_size'], first['compressed_size'])
+
+    def test_png_flattens_transparency_onto_white(self):
+        """Test that transparent PNG pixels become white"""
+        input_path = self.create_transparent_image()
+        output_path = self.temp_path("flattened.png")
+
+        result = self.compressor.compress_image(input_path, output_path, 'PNG Optimization')
+
+        self.assertTrue(result['success'])
+        with Image.open(output_path) as img:
+            self.assertEqual(img.mode, 'RGB')
+            self.assertEqual(img.getpixel((0, 0)), (255, 255, 255))
+
+    def test_png_optimization_prefers_webp_lossless(self):
+        """Test that PNG Optimization can write lossless WebP instead"""
+        compressor = ImageCompressor(prefer_webp_lossless=True)
+        input_path = self.temp_path("graphic.png")
+        # Non-zero alpha: WebP may discard the color of fully transparent pixels
+        pixels = np.random.default_rng(0).integers(1, 256, (32, 32, 4), dtype=np.uint8)
+        Image.fromarray(pixels, 'RGBA').save(input_path, 'PNG')
+
+        output_path = compressor.get_output_path(input_path, self.temp_dir, 'PNG Optimization')
+        self._created.append(output_path)
+        self.assertTrue(output_path.endswith("graphic_compressed.webp"))
+
+        result = compressor.compress_image(input_path, output_path, 'PNG Optimization')
+        self.assertTrue(result['success'])
+        self.assertEqual(result['output_format'], 'WEBP')
+        with Image.open(output_path) as img:
+            self.assertEqual(img.format, 'WEBP')
+            np.testing.assert_array_equal(np.asarray(img.convert('RGBA')), pixels)
+
+        # An explicit .png output path still gets PNG
+        forced_path = self.temp_path("forced.png")
+        result = compressor.compress_image(input_path, forced_path, 'PNG Optimization')
+        self.assertEqual(result['output_format'], 'PNG')
+
+    def test_format_size(self):
+        """Test human readable file sizes"""
+        self.assertEqual(format_size(0), "0 B")
+        self.assertEqual(format_size(1023), "1023.0 B")
+        self.assertEqual(format_size(1024), "1.0 KB")
+        self.assertEqual(format_size(1536), "1.5 KB")
+        self.assertEqual(format_size(1024 ** 2), "1.0 MB")
+        self.assertEqual(format_size(2048 * 1024 ** 3), "2048.0 GB")
+
     def test_unsupported_format(self):
         """Test handling of unsupported formats"""
-        # Create a text file with .jpg extension
-        fake_image_path = os.path.join(self.temp_dir, "fake.jpg")
-        with open(fake_image_path, 'w') as f:
-            f.write("This is not an image")
-        
-        output_path = os.path.join(self.temp_dir, "output.jpg")
+        # The test covers our error handling, not Pillow's format detection,
+        # so have Image.open reject the input straight away
+        output = io.BytesIO()
         
-        result = self.compressor.compress_image(
-            fake_image_path,
-            output_path,
-            'JPEG Quality',
-            quality=85
-        )
+        with patch('src.image_compressor.Image.open',
+                   side_effect=UnidentifiedImageError("cannot identify image file")):
+            result = self.compressor.compress_image(
+                b"This is not an image",
+                output,
+                'JPEG Quality',
+                quality=85
+            )
         
         self.assertFalse(result['success'])
         self.assertIn('error', result)
+        self.assertEqual(output.getvalue(), b"")
     
-    def tearDown(self):
-        """Clean up test fixtures"""
-        import shutil
-        shutil.rmtree(self.temp_dir)
+    @classmethod
+    def tearDownClass(cls):
+        """Check expected outputs, then clean up test fixtures"""
+        missing = [path for path in cls._outputs if not os.path.exists(path)]
+        
+        # Remove newest first so folders are empty by the time they go
+        for path in reversed(cls._created):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except IsADirectoryError:
+                # Folders filled by the code under test, e.g. the cache
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        os.unlink(entry.path)
+                os.rmdir(path)
+        os.unlink(cls.test_image_path)
+        os.rmdir(cls.temp_dir)
+        
+        assert not missing, f"expected outputs were not written: {missing}"
 
 if __name__ == '__main__':
     unittest.main()